@@ -1,14 +1,22 @@
-import readline, cmd, sys, time, datetime, pprint, term
-
-from protocol import RpcClient, ApiError
+import time
+startTime = time.perf_counter()
+
+import readline, cmd, sys, datetime, pprint, queue, asyncio, term, config, stats
+
+from protocol import RpcClient, AsyncRpcClient, ApiError
+from catalog import ProductCatalog, GroupRegistry
+from cart import Cart, Product
+from monitor import HealthMonitor
+from spooler import PrintSpooler
+from completion import CompletionRefresher
+from dispatch import InputClassifier
+from journal import TransactionJournal
+from session import SessionManager
+from prefetch import Prefetcher
+import state
 
 from datetime import datetime
 
-try:
-  from printer import ReceiptPrinter
-except:
-  msgWarning("No printer support available!")
-
 class Shell(cmd.Cmd):
 	def do_register(self, arg):
 		arg = arg.split(" ")
@@ -46,6 +54,7 @@ class Shell(cmd.Cmd):
 				[],
 				[{"description":"Deposit", "price":-amount, "amount":1}]
 			)
+			prefetcher.clear()
 			
 			shell.do_clear("")
 			
@@ -53,7 +62,6 @@ class Shell(cmd.Cmd):
 			
 			msgConfirm("Deposit completed!")
 			
-			global cart
 			if len(cart) > 0:
 				print("Warning: there are still products in the cart. Either enter your name to buy the products or enter \"abort\" to cancel the pending transaction.")
 			
@@ -64,17 +72,17 @@ class Shell(cmd.Cmd):
 	def do_amount(self, arg):
 		arg = arg.split(" ")
 		
-		global cart, lastProduct
+		global lastProduct
 		
 		if not lastProduct:
 			msgError("Add a product to the cart first!")
 			return
 		
 		if len(arg) == 1 and arg[0] == "":
-			if lastProduct["package"] != None:
-				amount = prompt(client, "Amount of "+lastProduct["name"]+" [unit: "+lastProduct["package"]["name"]+"] >")
+			if lastProduct.package != None:
+				amount = prompt(client, "Amount of "+lastProduct.name+" [unit: "+lastProduct.package["name"]+"] >")
 			else:
-				amount = prompt(client, "Amount of "+lastProduct["name"]+" >")
+				amount = prompt(client, "Amount of "+lastProduct.name+" >")
 		elif not len(arg) == 1:
 			print("Usage: amount <amount>")
 			return
@@ -87,29 +95,24 @@ class Shell(cmd.Cmd):
 			msgError("Not a number!")
 			return
 		
-		for cartRow in cart:
-			if (cart[cartRow]["product"]["id"] == lastProduct["id"]):
-				if (amount == 0):
-					cart.pop(cartRow)
-					shell.do_clear("")
-					msgWarning("Removed "+lastProduct["name"]+" from the cart")
-				else:
-					cart[cartRow]["amount"] = amount
-					shell.do_clear("")
-					unit = ""
-					if lastProduct["package"] != None:
-						unit = " "+lastProduct["package"]["name"]
-					print("(Changed amount of "+lastProduct["name"]+" to "+str(amount)+unit+")")
-				return
+		if lastProduct.id in cart:
+			if (amount == 0):
+				cart.remove(lastProduct.id)
+				shell.do_clear("")
+				msgWarning("Removed "+lastProduct.name+" from the cart")
+			else:
+				cart.setAmount(lastProduct.id, amount)
+				shell.do_clear("")
+				unit = ""
+				if lastProduct.package != None:
+					unit = " "+lastProduct.package["name"]
+				print("(Changed amount of "+lastProduct.name+" to "+str(amount)+unit+")")
+			return
 		
 		if (amount != 0):
-			productsToCart(client, [lastProduct])
-			msgConfirm("Added "+lastProduct["name"]+" to the cart")
-			for cartRow in cart:
-				if (cart[cartRow]["product"]["id"] == lastProduct["id"]):
-					cart[cartRow]["amount"] = amount
-					shell.do_clear("")
-					return
+			cart.add(lastProduct, amount)
+			msgConfirm("Added "+lastProduct.name+" to the cart")
+			shell.do_clear("")
 
 	def do_remove(self, arg):
 		if not arg == "":
@@ -121,12 +124,11 @@ class Shell(cmd.Cmd):
 		if not arg == "":
 			print("Usage: clear")
 			return
-		term.clear()
+		term.invalidate()
 		self.emptyline()
 		
 	def do_abort(self, arg):
-		global cart
-		cart = {}
+		cart.clear()
 		self.emptyline()
 		shell.do_clear("")
 		msgError("Transaction canceled!")
@@ -143,6 +145,20 @@ class Shell(cmd.Cmd):
 			return
 		printReceipt()
 	
+	def do_stats(self, arg):
+		if arg == "reset":
+			stats.reset()
+			msgConfirm("Statistics cleared")
+			return
+		if not arg == "":
+			print("Usage: stats [reset]")
+			return
+		print("")
+		headerInfo("STATISTICS")
+		for line in stats.report():
+			print(line)
+		print("")
+	
 	def do_help(self, arg):
 		print("")
 		print("\u001b[103m\u001b[30m  ~~~  Welcome to the Tkkrlab barsystem  ~~~  \u001b[49m\u001b[39m")
@@ -154,6 +170,7 @@ class Shell(cmd.Cmd):
 		print(" - clear      Clear screen")
 		print(" - abort      Abort transaction")
 		print(" - print      Print receipt")
+		print(" - stats      Show request and rendering statistics")
 		print(" - cyber      Everyone needs a bit of cyber")
 		print(" - help       You've found this one! :D")
 		print("")
@@ -163,11 +180,23 @@ class Shell(cmd.Cmd):
 			sys.exit()
 
 		try:
-			waitForConnection()
-
-			if (len(line)>0):
-				if not findPerson(client, line):
-					if not product(client, line):
+			if not monitor.is_up:
+				offline(line)
+			elif (len(line)>0):
+				kind = classifier.classify(line)
+				if kind != classifier.PERSON and len(cart) < 1:
+					# A product lookup on an empty cart is followed by the first cart screen
+					prefetcher.prefetch("groups", groups.list)
+				if kind == classifier.PRODUCT:
+					person, products = None, catalog.find(line)
+				elif kind == classifier.BARCODE:
+					person, products = None, client.productFindByIdentifier(line.strip())
+				elif kind == classifier.PERSON:
+					person, products = prefetchPerson(line).result(), None
+				else:
+					person, products = client.find(line)
+				if not showPerson(client, person):
+					if not product(client, line, products):
 						print("\u001b[31mError: unknown command, user or product.\u001b[39m")
 						showHeader = False
 					else:
@@ -176,50 +205,74 @@ class Shell(cmd.Cmd):
 					showHeader = False
 		except ApiError as e:
 			print("\u001b[31mServer error:",e,"\u001b[39m")
+		except IOError as e:
+			monitor.markDown()
+			print("\u001b[31mConnection error:",e,"\u001b[39m")
 		
 		setPrompt()
 	
+	def precmd(self, line):
+		# The prompt and whatever the user typed are on screen now
+		term.invalidate()
+		return line
+	
+	def postcmd(self, stop, line):
+		reportPrintJobs()
+		reportJournal()
+		return stop
+	
 	def completedefault(self, *args):
 		self.completenames(*args)
 	
 	def completenames(self, text, line, begidx, endidx):
 		#print("Complete",text,line,begidx,endidx)
-		query = readline.get_line_buffer().lstrip().lower()
-		results = []
-		#print("Complete",text, query)
-		for product in clProducts:
-			if product.startswith(text):
-				results.append(product)
-		for persons in clPersons:
-			if persons.startswith(text):
-				results.append(persons)
-		#print(results)
-		if len(results)>0:
-			return results
-		return []
+		index = completion.index
+		results = index.complete(text)
+		if len(results) < 1 and fuzzyCompletion:
+			results = index.fuzzy(text)
+		# Typing a member's nickname: start loading their account and history before they press enter
+		persons = [result for result in results if result in personCache]
+		if len(persons) == 1:
+			prefetchPerson(persons[0])
+		return results
 	
 	def emptyline(self):
-		waitForConnection()
 		#term.clear()
-		print("")
-		if (len(cart) == 0):
+		with term.frame():
 			term.clear()
-			headerConfirm("")
-			headerConfirm("  The cart is empty. Scan a product to add it to the cart!")
-			headerConfirm("")
-			print("")
-		else:
-			term.clear()
-			headerWarning("")
-			headerWarning("  The cart contains products. Enter your name to confirm the transaction!")
-			headerWarning("")
-			print("")
-		usage()
+			if not monitor.is_up or journal.pending() > 0:
+				headerError("  Offline mode: "+str(journal.pending())+" transaction(s) waiting to be sent to the server")
+			if (len(cart) == 0):
+				headerConfirm("")
+				headerConfirm("  The cart is empty. Scan a product to add it to the cart!")
+				headerConfirm("")
+				print("")
+			else:
+				headerWarning("")
+				headerWarning("  The cart contains products. Enter your name to confirm the transaction!")
+				headerWarning("")
+				print("")
+			usage()
+
+def offline(line):
+	# Without the server only products from the catalog and members with a cached account can be used
+	if len(line) < 1:
+		return
+	kind = classifier.classify(line)
+	if kind == classifier.PRODUCT:
+		product(client, line, catalog.find(line))
+	elif kind == classifier.PERSON and len(cart) > 0:
+		global lastPerson
+		lastPerson = personCache[line.strip().lower()]
+		executeTransaction(client, lastPerson)
+	else:
+		msgError("Server unavailable: only known products and members can be used right now.")
 
 def waitForConnection():
-	while not client.ping():
-		print("Server unavailable. Reconnecting in 2 seconds...")
-		time.sleep(2)
+	if monitor.is_up:
+		return
+	print("Server unavailable. Waiting for the connection to come back...")
+	monitor.wait()
 
 def convertCommas(i):
 	return i.replace(',','.')
@@ -236,43 +289,31 @@ def halt(message, error=None):
 def msgError(message):
 	term.color(40,91,5)
 	print(message)
-	term.color(0)
-	term.color()
+	term.color(0, 37, 40, 1)
 
 def msgWarning(message):
 	term.color(40,93,5)
 	print(message)
-	term.color(0)
-	term.color()
+	term.color(0, 37, 40, 1)
 
 def msgConfirm(message):
 	term.color(40,92,5)
 	print(message)
-	term.color(0)
-	term.color()
+	term.color(0, 37, 40, 1)
 
 def headerError(message="TkkrLab barsystem"):
 	term.header(message, 41, 97, 1, False)
-	term.color(0)
-	term.color()
 
 def headerWarning(message="TkkrLab barsystem"):
 	term.header(message, 30, 103, 1, False)
-	term.color(0)
-	term.color()
 
 def headerConfirm(message="TkkrLab barsystem"):
 	term.header(message, 42, 97, 1, False)
-	term.color(0)
-	term.color()
 	
 def headerInfo(message="TkkrLab barsystem"):
 	term.header(message, 44, 97, 1, False)
-	term.color(0)
-	term.color()
 
 def usage():
-	global cart
 	if len(cart) > 0:
 		print("")
 		#headerInfo("HELP")
@@ -297,8 +338,27 @@ def setPrompt():
 	else:
 		shell.prompt = "\nCommand, user (buy products) or product (add to cart)? > "
 
+def startupPhase(name):
+	startupPhases.append((name, time.perf_counter()))
+
+def printStartupProfile():
+	headerInfo("STARTUP PROFILE")
+	last = startTime
+	for name, timestamp in startupPhases:
+		print('{0: <24}'.format(name)+'{0: >8.1f} ms'.format((timestamp-last)*1000))
+		last = timestamp
+	print('{0: <24}'.format("Total")+'{0: >8.1f} ms'.format((last-startTime)*1000))
+	print("(Printer, product and person lists are loaded in the background)")
+
+def openPrinter():
+	# Imported here so serial, six and PIL are only loaded when a printer is used
+	from printer import ReceiptPrinter
+	return ReceiptPrinter(config.kodak, "/dev/ttyUSB0")
+
 def main():
-	global client, shell
+	global client, asyncClient, shell, catalog, groups, monitor, spooler, classifier, journal
+	
+	startupPhase("Imports")
 	
 	term.clear()
 	msgWarning("Loading configuration...")
@@ -319,62 +379,128 @@ def main():
 	except:
 		halt("Configuration error", "Could read password file.")
 
+	startupPhase("Configuration")
+
 	msgWarning("Connecting to server ({})...".format(uri))
 
 	client = RpcClient(uri)
+	asyncClient = AsyncRpcClient(client)
+	monitor = HealthMonitor(client)
+	monitor.check() # Know the server state before the first wait, not after the first ping of the thread
+	monitor.start()
 	
 	waitForConnection()
+	startupPhase("Connection")
 	
-	if not client.createSession():
-		halt("Communication error", "Could not start the session!")
+	saved = state.load(stateFile)
+	if saved != None and saved.get("uri") == uri and saved.get("token"):
+		# Checked on first use, an expired token is replaced transparently
+		client.restoreSession(saved["token"], saved["created"], saved["user"], "barsystem", password)
+		startupPhase("Session restored")
+	else:
+		saved = None
+		if not client.createSession():
+			halt("Communication error", "Could not start the session!")
+		startupPhase("Session")
 
-	if not client.login("barsystem", password):
-		halt("Communication error", "Could not authenticate!")
+		if not client.login("barsystem", password):
+			halt("Communication error", "Could not authenticate!")
+		startupPhase("Authentication")
 	
-	msgWarning("Connecting to printer...")
+	client.onSession = saveState
+	SessionManager(client).start()
 	
-	global printer
-	try:
-		printer = ReceiptPrinter("/dev/ttyUSB0")
-	except:
-		printer = None
-		msgWarning("Printer not available!")
+	spooler = PrintSpooler(openPrinter)
+	
+	journal = TransactionJournal()
+	journal.start(client, monitor)
+	
+	catalog = ProductCatalog(client)
+	if saved != None:
+		catalog.update(saved.get("catalog", []))
+	groups = GroupRegistry(client)
+	classifier = InputClassifier(catalog)
 	
 	msgWarning("Welcome!")
 	
-	initCompletion()	
+	initCompletion()
+	startupPhase("Background tasks")
+
 	shell = Shell()
 	setPrompt()
 	shell.do_clear("")
+	startupPhase("Prompt")
+	if "--startup-profile" in sys.argv:
+		printStartupProfile()
+	for arg in sys.argv[1:]:
+		if arg.startswith("--stats-file="):
+			stats.startDump(arg[len("--stats-file="):])
 	shell.cmdloop()
 
 pp = pprint.PrettyPrinter(indent=4)
 
-cart = {}
+cart = Cart()
 lastCmd = ''
 lastPerson = None
 lastProduct = None
 cmd_params = []
 development = False
+fuzzyCompletion = True
+completion = CompletionRefresher(list)
 lastTransaction = []
 lastTransactionTotal = []
-
-def initCompletion():
-	global clProducts, clPersons
-	clProducts = []
-	clPersons = []
-	print("Please wait, querying list of products...")
-	products = client.productList({})
-	for product in products:
-		clProducts.append(product["name"].lower())
-	print("Please wait, querying list of persons...")
-	persons = client.personList({})
+spooler = None
+startupPhases = []
+personCache = {}
+catalog = None
+prefetcher = Prefetcher()
+stateFile = 'spacecore-cli.state'
+
+async def downloadLists():
+	# The product and person lists don't depend on each other, download them at the same time.
+	# Products stream straight into the catalog; this is the only thing that refreshes it.
+	loop = asyncio.get_running_loop()
+	loaded, persons = await asyncio.gather(loop.run_in_executor(None, catalog.load), asyncClient.iter_persons({}, personFields))
+	return persons
+
+# Fields of the person list used offline (see offline() and journalTransaction())
+personFields = ["id", "nick_name", "first_name", "last_name", "balance", "person_group_id"]
+
+def completionNames():
+	global personCache
+	persons = asyncio.run(downloadLists())
+	names = []
+	for product in catalog.products():
+		names.append(product.name.lower())
+	cache = {}
 	for person in persons:
-		clPersons.append(person["nick_name"].lower())
+		cache[person["nick_name"].lower()] = person
+	personCache = cache
+	nicknames = list(cache.keys())
+	classifier.setNicknames(nicknames)
+	saveState()
+	return names + nicknames
+
+def saveState():
+	if catalog == None:
+		return
+	try:
+		state.save(stateFile, client, catalog)
+	except (IOError, OSError):
+		pass # Only costs a slower next start
 
-def product(client, name):
-	global cart, lastProduct
-	results = client.productFindByIdentifier(name) + client.productFindByName(name)
+def initCompletion():
+	global completion
+	completion = CompletionRefresher(completionNames)
+	completion.start()
+
+def product(client, name, results=None):
+	global lastProduct
+	if results == None:
+		results = catalog.find(name)
+		if len(results) < 1:
+			results = client.productFind(name)
+	results = [result if isinstance(result, Product) else Product.fromDict(result) for result in results]
 	if len(results) > 0:
 		if len(results) > 1:
 			#sys.stdout.write("\r\n\u001b[31mError: multiple results for query!\u001b[39m\r\n\r\n")
@@ -385,7 +511,7 @@ def product(client, name):
 				product = results[i]
 				#mbr_pr = str(round(float(product['member_price']),2))
 				#std_pr = str(round(float(product['standard_price']),2))
-				print(str(i+1)+". "+'{0: <25}'.format(product['name']))#+'{0: <6}'.format("€ "+mbr_pr)+" / "+'{0: <6}'.format("€ "+std_pr))
+				print(str(i+1)+". "+'{0: <25}'.format(product.name))#+'{0: <6}'.format("€ "+mbr_pr)+" / "+'{0: <6}'.format("€ "+std_pr))
 			try:
 				choice = int(prompt(client, "\r\nPick one (or abort):"))-1
 				if (choice >= 0) and (choice < len(results)):
@@ -406,8 +532,8 @@ def product(client, name):
 
 		shell.do_clear("")
 
-		if result['package'] != None:
-			if result['package']['ask']:
+		if result.package != None:
+			if result.package['ask']:
 				shell.do_amount("")
 
 		return True
@@ -415,21 +541,32 @@ def product(client, name):
 	return False
 
 def executeTransaction(client, person):
-	global cart
-		
 	product_rows = []
 	
-	for cartRow in cart:
-		data = {"id": cart[cartRow]["product"]["id"], "amount": cart[cartRow]["amount"]}
+	for line in cart:
+		data = {"id": line.product.id, "amount": line.amount}
 		product_rows.append(data)
 	
-	transaction = client.invoiceExecute(
-		person["id"],
-		product_rows,
-		[]
-	)
+	key = journal.newKey()
+	transaction = None
+	# While transactions are waiting in the journal, queue behind them so the server sees them in order
+	if monitor.is_up and journal.pending() < 1:
+		try:
+			transaction = client.invoiceExecute(
+				person["id"],
+				product_rows,
+				[],
+				key
+			)
+		except IOError:
+			# The server may or may not have the transaction, the idempotency key makes replaying it safe
+			monitor.markDown()
+	if transaction == None:
+		journalTransaction(person, product_rows, key)
+		return
 
-	cart = {}
+	cart.clear()
+	prefetcher.clear() # Balances and histories changed
 
 	shell.do_clear("")
 
@@ -438,6 +575,34 @@ def executeTransaction(client, person):
 	printTransaction(transaction)
 
 
+def journalTransaction(person, product_rows, key):
+	global lastTransaction, lastTransactionTotal
+	
+	total = None
+	group = person.get("person_group_id", None)
+	if group != None:
+		total = cart.total(group)
+	
+	journal.append(person, product_rows, [], total, key)
+	prefetcher.clear()
+	
+	# The server has not booked this yet, so there is no receipt to print
+	lastTransaction = []
+	lastTransactionTotal = []
+	
+	cart.clear()
+	
+	shell.do_clear("")
+	
+	msgWarning("Transaction saved, it will be sent to the server as soon as possible ("+str(journal.pending())+" waiting).")
+	if total != None:
+		print("Transaction total:\t\t€ "+'{0: <6}'.format("{:.2f}".format(total/100.0)))
+	print("")
+
+def reportJournal():
+	for record, error in journal.poll():
+		msgError("Offline transaction of "+record["nick_name"]+" was rejected by the server: "+str(error))
+
 def printTransaction(transaction, neg=False, noAmount=False, person=None):
 	global lastPerson, lastTransaction, lastTransactionTotal
 	
@@ -472,16 +637,18 @@ def printTransaction(transaction, neg=False, noAmount=False, person=None):
 		("Balance after transaction",transaction['person']['balance']/100.0)
 		]
 	
-	global printer
-	if printer != None:
+	global spooler
+	if spooler != None and spooler.available:
 		print("\n")
 		print("Use 'print' to print this receipt.")
 	print("")
 
 	
 def findPerson(client, name, doTransaction=True, showInfo=True):
-	global cart, lastPerson
-	person = client.personFind(name)
+	return showPerson(client, client.personFind(name), doTransaction, showInfo)
+
+def showPerson(client, person, doTransaction=True, showInfo=True):
+	global lastPerson
 	if (person != None):
 		if (len(cart)<1) and showInfo:
 			print("")
@@ -500,9 +667,18 @@ def findPerson(client, name, doTransaction=True, showInfo=True):
 		return person
 	return None
 
+def prefetchPerson(nickname):
+	# Person lookup, followed right away by their invoice history, which showPerson() prints next
+	def lookup():
+		person = client.personFind(nickname)
+		if person != None:
+			prefetcher.prefetch(("invoices", person['id'], 5), client.lastInvoicesOfPerson, person['id'], 5)
+		return person
+	return prefetcher.prefetch(("person", nickname.strip().lower()), lookup)
+
 def printLastTransactionsOfPerson(person, amount):
 	global client
-	lastTransactions = client.lastInvoicesOfPerson(person, amount)
+	lastTransactions = prefetcher.get(("invoices", person, amount), client.lastInvoicesOfPerson, person, amount)
 	for transaction in lastTransactions:
 		when = datetime.fromtimestamp(transaction['timestamp']).strftime('%Y-%m-%d %H:%M:%S')+" (€ {0: <8})".format("{:.2f}".format(transaction['total']/100.0))
 		for row in transaction['rows']:
@@ -512,45 +688,35 @@ def printLastTransactionsOfPerson(person, amount):
 	
 
 def productsToCart(client, products):
-	global cart
 	for i in products:
-		product_id = i["id"]
-		if not product_id in cart:
-			cart[product_id] = {"product": i, "amount": 1}
-		else:
-			item = cart[product_id]
-			item["amount"]+=1
-			cart[product_id] = item
+		cart.add(i)
 
 def printCart():
-	global cart, client
 	if len(cart) > 0:
 		print("")
 		headerInfo("CART")
-		for i in cart:
-			product = cart[i]["product"]
-			amount = cart[i]["amount"]
+		personGroups = prefetcher.get("groups", groups.list)
+		for cartLine in cart:
+			product = cartLine.product
+			amount = cartLine.amount
 			unit = ""
-			if product['package'] != None:
-				unit = product['package']['name']
-			line = '{0: >4}'.format(str(amount))+" "+'{0: <16}'.format(unit)+'{0: <25}'.format(product['name'])
+			if product.package != None:
+				unit = product.package['name']
+			line = '{0: >4}'.format(str(amount))+" "+'{0: <16}'.format(unit)+'{0: <25}'.format(product.name)
 			line += "\t"
-			groups = client.getGroups()
-			for i in range(len(groups)):
-				group = groups[i]
-				last = i < (len(groups) - 1)
-				if last:
-					last = " / "
-				else:
-					last = ""
-				price = False
-				for entry in product['prices']:
-					if entry['person_group_id'] == group['id']:
-						price = entry['amount']
+			for i in range(len(personGroups)):
+				group = personGroups[i]
+				price = product.price(group['id'])
 				if price:
 					price = "€ "+'{0: <6}'.format("{:.2f}".format(price*amount/100.0))
 					line += '{0: <6}'.format(price)
 			print(line)
+		line = '{0: <46}'.format("Total")+"\t"
+		for group in personGroups:
+			total = cart.total(group['id'])
+			if total != None:
+				line += '{0: <6}'.format("€ "+'{0: <6}'.format("{:.2f}".format(total/100.0)))
+		print(line)
 		print("")
 
 # Shell helper functions
@@ -573,13 +739,13 @@ def queryLocation(client):
 		return -1
 
 def queryGroup(client):
-	groups = client.getGroups()
-	for group in groups:
+	personGroups = groups.list()
+	for group in personGroups:
 		print(str(group["id"])+". "+group["name"])
 	group_id = prompt(client, "Group? > ",False,False)
 	try:
 		group_id = int(group_id)
-		for group in groups:
+		for group in personGroups:
 			if (group_id == group["id"]):
 				return group_id
 	except:
@@ -587,9 +753,9 @@ def queryGroup(client):
 	return None
 		
 def setprice(client):
-	global lastProduct, cmd_params, cart
+	global lastProduct, cmd_params
 	if lastProduct:
-		print("Set price of of "+lastProduct['name']+".")
+		print("Set price of of "+lastProduct.name+".")
 		group = queryGroup(client)
 		if (group == None):
 			print("Invalid input.")
@@ -598,15 +764,16 @@ def setprice(client):
 		if (price == None):
 			print("Invalid input.")
 			return
-		print("Setting price of "+str(lastProduct["id"])+" to "+str(price)+" for group "+str(group))
-		client.productSetPrice(lastProduct["id"], group, price)
-		cart = {}
+		print("Setting price of "+str(lastProduct.id)+" to "+str(price)+" for group "+str(group))
+		client.productSetPrice(lastProduct.id, group, price)
+		catalog.load()
+		cart.clear()
 	else:
 		print("No product.")
 		
 def listgroups(client):
-	groups = client.getGroups()
-	for group in groups:
+	groups.invalidate()
+	for group in groups.list():
 		print(str(group["id"])+". "+group["name"])
 		
 def lasttransactions():
@@ -653,9 +820,9 @@ def prompt(client, prompt=">",header=False, headerCart=False, history=False):
 	return i
 
 def printReceipt():
-	global printer, lastPerson, lastTransaction, lastTransactionTotal
+	global spooler, lastPerson, lastTransaction, lastTransactionTotal
 	
-	if printer == None:
+	if spooler == None or not spooler.available:
 		msgError("No printer available.")
 		return
 	
@@ -667,42 +834,61 @@ def printReceipt():
 	if (len(lastPerson['first_name'])+len(lastPerson['last_name'])) > 0:
 		customer_name = lastPerson['first_name']+" "+lastPerson['last_name']
 	
-	printer.init()
-	printer.set_code_table('cp858')
-	printer.print_image('tkkrlab.bmp')
-	printer.feed(1)
-	printer.set_align(printer.ALIGN_CENTER)
-	printer.set_print_mode(printer.PRINTMODE_FONT_A)
-	printer.writeline('*** TkkrLab Barsystem ***')
-	printer.feed(1)
-	printer.set_align(printer.ALIGN_LEFT)
-	printer.writeline('Customer {}'.format(customer_name))
-	printer.writeline('Date     {}'.format(time.strftime('%Y-%m-%d %H:%M:%S')))
-	printer.feed(2)
-
-	printer.set_align(printer.ALIGN_LEFT)
-	printer.set_print_mode(printer.PRINTMODE_FONT_B)
-
-	# products
-	for name, amount, cost in lastTransaction:
-		printer.write_product_line(name, cost, amount)
-
-	printer.set_print_mode(printer.PRINTMODE_FONT_A)
-	printer.writeline('-' * 42)
-	printer.set_print_mode(printer.PRINTMODE_FONT_B | printer.PRINTMODE_EMPHASIZED | printer.PRINTMODE_DOUBLE_HEIGHT)
-	first = True
-	for name, cost in lastTransactionTotal:
-		printer.write_product_line(name, cost)
-		if first:
-			first = False
-			printer.set_print_mode(printer.PRINTMODE_FONT_B | printer.PRINTMODE_EMPHASIZED)
-			printer.feed(1)
-	printer.set_print_mode(printer.PRINTMODE_FONT_A)
-
-	printer.feed(6)
-	printer.cut(0)
+	date = time.strftime('%Y-%m-%d %H:%M:%S')
+	rows = list(lastTransaction)
+	totals = list(lastTransactionTotal)
+	
+	try:
+		spooler.submit("Receipt for "+customer_name, lambda printer: writeReceipt(printer, customer_name, date, rows, totals))
+	except queue.Full:
+		msgError("The printer is busy, try again in a moment.")
+		return
 	
 	msgConfirm("Receipt sent to the printer!")
 
+def writeReceipt(printer, customer_name, date, rows, totals):
+	with printer.job():
+		printer.init()
+		printer.set_code_table('cp858')
+		printer.print_image('tkkrlab.bmp')
+		printer.feed(1)
+		printer.set_align(printer.ALIGN_CENTER)
+		printer.set_print_mode(printer.PRINTMODE_FONT_A)
+		printer.writeline('*** TkkrLab Barsystem ***')
+		printer.feed(1)
+		printer.set_align(printer.ALIGN_LEFT)
+		printer.writeline('Customer {}'.format(customer_name))
+		printer.writeline('Date     {}'.format(date))
+		printer.feed(2)
+
+		printer.set_align(printer.ALIGN_LEFT)
+		printer.set_print_mode(printer.PRINTMODE_FONT_B)
+
+		# products
+		for name, amount, cost in rows:
+			printer.write_product_line(name, cost, amount)
+
+		printer.set_print_mode(printer.PRINTMODE_FONT_A)
+		printer.writeline('-' * 42)
+		printer.set_print_mode(printer.PRINTMODE_FONT_B | printer.PRINTMODE_EMPHASIZED | printer.PRINTMODE_DOUBLE_HEIGHT)
+		first = True
+		for name, cost in totals:
+			printer.write_product_line(name, cost)
+			if first:
+				first = False
+				printer.set_print_mode(printer.PRINTMODE_FONT_B | printer.PRINTMODE_EMPHASIZED)
+				printer.feed(1)
+		printer.set_print_mode(printer.PRINTMODE_FONT_A)
+
+		printer.feed(6)
+		printer.cut(0)
+
+def reportPrintJobs():
+	if spooler == None:
+		return
+	for job in spooler.poll():
+		if job.status == job.FAILED:
+			msgError("Printing failed ("+job.description+"): "+str(job.error))
+
 if __name__ == '__main__':
 	main()
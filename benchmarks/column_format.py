@@ -0,0 +1,30 @@
+# Compares the PIL and NumPy column-format conversion paths of ReceiptPrinter
+# Usage: python3 benchmarks/column_format.py [repeat]
+import os, sys, timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+from printer import ReceiptPrinter
+
+def image(width, height):
+	im = Image.effect_noise((width, height), 64).convert("1")
+	return im.transpose(Image.ROTATE_270).transpose(Image.FLIP_LEFT_RIGHT)
+
+def main():
+	repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+	printer = ReceiptPrinter.__new__(ReceiptPrinter) # No serial port needed for the conversion
+	logo = Image.open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tkkrlab.bmp")).convert("1")
+	cases = [
+		("logo", logo.transpose(Image.ROTATE_270).transpose(Image.FLIP_LEFT_RIGHT)),
+		("full width 576x576", image(576, 576)),
+		("full width 576x2048", image(576, 2048)),
+	]
+	for name, im in cases:
+		assert printer._to_column_format_pil(im, 24) == printer._to_column_format_numpy(im, 24)
+		pil = min(timeit.repeat(lambda: printer._to_column_format_pil(im, 24), number=1, repeat=repeat))
+		vec = min(timeit.repeat(lambda: printer._to_column_format_numpy(im, 24), number=1, repeat=repeat))
+		print("{0: <22} pil {1:8.2f} ms   numpy {2:8.2f} ms   {3:5.1f}x".format(name, pil*1000, vec*1000, pil/vec))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,151 @@
+# Runs the benchmark scenarios against the stand-in server and writes a JSON report
+# Usage: python3 benchmarks/run.py [--products=1000] [--persons=200] [--latency=0.005] [--repeat=50] [--output=report.json]
+import os, sys, time, json, random, statistics, subprocess, asyncio
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import server
+from protocol import RpcClient, AsyncRpcClient
+from catalog import ProductCatalog
+from completion import CompletionIndex
+from dispatch import InputClassifier
+
+def summary(samples):
+	ordered = sorted(samples)
+	return {
+		"n": len(ordered),
+		"min_ms": ordered[0]*1000,
+		"median_ms": statistics.median(ordered)*1000,
+		"p95_ms": ordered[min(len(ordered)-1, int(round(0.95*(len(ordered)-1))))]*1000,
+		"mean_ms": statistics.mean(ordered)*1000
+	}
+
+def measure(function, repeat):
+	samples = []
+	for i in range(repeat):
+		start = time.perf_counter()
+		function()
+		samples.append(time.perf_counter() - start)
+	return summary(samples)
+
+def connect(uri):
+	client = RpcClient(uri)
+	client.ping()
+	client.createSession()
+	client.login("barsystem", "secret")
+	return client
+
+def startup(uri, repeat):
+	def prompt():
+		connect(uri).close()
+	def lists():
+		client = connect(uri)
+		asyncClient = AsyncRpcClient(client)
+		async def download():
+			return await asyncio.gather(asyncClient.productList({}), asyncClient.personList({}))
+		products, persons = asyncio.run(download())
+		ProductCatalog(client).update(products)
+		asyncClient.close()
+		client.close()
+	return {"prompt": measure(prompt, repeat), "lists_loaded": measure(lists, max(1, repeat // 5))}
+
+def scan(client, backend, repeat):
+	catalog = ProductCatalog(client)
+	catalog.load()
+	classifier = InputClassifier(catalog)
+	classifier.setNicknames([person["nick_name"] for person in backend.persons])
+	barcodes = [product["identifiers"][0]["value"] for product in backend.products]
+	def local():
+		line = random.choice(barcodes)
+		if classifier.classify(line) == classifier.PRODUCT:
+			catalog.find(line)
+	def miss():
+		line = "unknown {}".format(random.randint(0, 1000000))
+		if classifier.classify(line) == classifier.UNKNOWN:
+			client.find(line)
+	return {"catalog_hit": measure(local, repeat), "server_lookup": measure(miss, repeat)}
+
+def checkout(client, backend, repeat):
+	def run():
+		person = random.choice(backend.persons)
+		product = random.choice(backend.products)
+		client.invoiceExecute(person["id"], [{"id": product["id"], "amount": 1}], [])
+	return {"invoice_create": measure(run, repeat)}
+
+def completion(backend, repeat):
+	names = [product["name"].lower() for product in backend.products] + [person["nick_name"] for person in backend.persons]
+	index = CompletionIndex(names)
+	prefixes = [name[:random.randint(1, len(name))] for name in random.sample(names, min(len(names), 100))]
+	return {
+		"prefix": measure(lambda: index.complete(random.choice(prefixes)), repeat),
+		"fuzzy": measure(lambda: index.fuzzy("pdt1"), repeat)
+	}
+
+def receipt(repeat):
+	try:
+		import printer
+	except ImportError as e:
+		return {"skipped": str(e)}
+	class NullSerial:
+		def __init__(self, **kwargs):
+			self.written = 0
+		def write(self, data):
+			self.written += len(data)
+		def flush(self):
+			pass
+	printer.serial.Serial = NullSerial
+	import app
+	os.chdir(root)
+	device = printer.ReceiptPrinter(True, cache_dir=None)
+	rows = [("Product {}".format(i), 1, 1.50) for i in range(5)]
+	totals = [("Total", 7.50), ("Balance before transaction", 10.0), ("Balance after transaction", 2.5)]
+	def render():
+		device._raster_cache.clear()
+		app.writeReceipt(device, "member1", "2000-01-01 00:00:00", rows, totals)
+	def cached():
+		app.writeReceipt(device, "member1", "2000-01-01 00:00:00", rows, totals)
+	return {"uncached": measure(render, max(1, repeat // 5)), "cached": measure(cached, repeat)}
+
+def version():
+	try:
+		return subprocess.check_output(["git", "-C", root, "describe", "--always", "--dirty"], stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def main():
+	opts = server.options(sys.argv[1:], {"products": 1000, "persons": 200, "latency": 0.005, "repeat": 50, "output": "benchmark-report.json"})
+	random.seed(1)
+	instance = server.serve(0, opts["products"], opts["persons"], opts["latency"])
+	uri = "http://127.0.0.1:{}/".format(instance.server_address[1])
+	backend = instance.backend
+	client = connect(uri)
+	repeat = opts["repeat"]
+	results = {
+		"startup": startup(uri, max(1, repeat // 5)),
+		"scan_to_cart": scan(client, backend, repeat),
+		"checkout": checkout(client, backend, repeat),
+		"completion": completion(backend, repeat),
+		"receipt": receipt(repeat)
+	}
+	report = {
+		"version": version(),
+		"timestamp": time.time(),
+		"python": sys.version.split()[0],
+		"parameters": {"products": opts["products"], "persons": opts["persons"], "latency": opts["latency"], "repeat": repeat},
+		"results": results
+	}
+	with open(opts["output"], 'w') as f:
+		json.dump(report, f, indent=2)
+	for scenario, cases in results.items():
+		for case, result in cases.items():
+			if isinstance(result, dict):
+				print('{0: <34}median {1:9.3f} ms   p95 {2:9.3f} ms'.format(scenario+" "+case, result["median_ms"], result["p95_ms"]))
+			else:
+				print('{0: <34}{1}'.format(scenario+" "+case, result))
+	print("Report written to "+opts["output"])
+	instance.shutdown()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,167 @@
+# Stand-in spacecore JSON-RPC server for benchmarks
+# Usage: python3 benchmarks/server.py [--port=8000] [--products=1000] [--persons=200] [--latency=0.005]
+import json, sys, time, threading, uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class Backend:
+	def __init__(self, products=1000, persons=200, groups=2):
+		self.lock = threading.Lock()
+		self.groups = [{"id": i+1, "name": "Group {}".format(i+1)} for i in range(groups)]
+		self.products = []
+		for i in range(products):
+			self.products.append({
+				"id": i+1,
+				"name": "Product {}".format(i+1),
+				"active": True,
+				"package": None,
+				"identifiers": [{"value": str(8710000000000 + i)}],
+				"prices": [{"person_group_id": group["id"], "amount": 100 + i % 200 + 10 * n} for n, group in enumerate(self.groups)]
+			})
+		self.persons = []
+		for i in range(persons):
+			self.persons.append({
+				"id": i+1,
+				"nick_name": "member{}".format(i+1),
+				"first_name": "",
+				"last_name": "",
+				"balance": 1000,
+				"person_group_id": self.groups[i % groups]["id"]
+			})
+		self.invoices = []
+		self.sessions = set()
+		self.methods = {
+			"ping": lambda params: "pong",
+			"session/create": self.sessionCreate,
+			"user/authenticate": lambda params: {"user_name": params["user_name"]},
+			"person/group/list": lambda params: self.groups,
+			"person/create": self.personCreate,
+			"person/listForVendingNoAvatar": lambda params: self.persons,
+			"person/findForVending": self.personFind,
+			"product/list/noimg": lambda params: self.products,
+			"product/find": self.productFind,
+			"product/findByIdentifier": self.productFindByIdentifier,
+			"product/price/set": self.productSetPrice,
+			"product/location/list": lambda params: [{"id": 1, "name": "Bar", "sub": None}],
+			"product/addStock": lambda params: True,
+			"product/removeStock": lambda params: True,
+			"invoice/create": self.invoiceCreate,
+			"invoice/list": lambda params: self.invoices,
+			"invoice/list/last": self.invoiceListLast
+		}
+
+	def sessionCreate(self, params):
+		token = str(uuid.uuid4())
+		self.sessions.add(token)
+		return token
+
+	def personCreate(self, name):
+		person = {"id": len(self.persons)+1, "nick_name": name, "first_name": "", "last_name": "", "balance": 0, "person_group_id": self.groups[0]["id"]}
+		self.persons.append(person)
+		return person
+
+	def personFind(self, name):
+		for person in self.persons:
+			if person["nick_name"] == name.lower():
+				return person
+		return None
+
+	def productFind(self, name):
+		name = name.lower()
+		return [product for product in self.products if name in product["name"].lower()]
+
+	def productFindByIdentifier(self, identifier):
+		return [product for product in self.products if {"value": identifier} in product["identifiers"]]
+
+	def productSetPrice(self, params):
+		product = self.products[params["product_id"]-1]
+		product["prices"] = [entry for entry in product["prices"] if entry["person_group_id"] != params["group_id"]]
+		product["prices"].append({"person_group_id": params["group_id"], "amount": params["amount"]})
+		return True
+
+	def invoiceCreate(self, params):
+		person = self.persons[params["person_id"]-1]
+		rows = []
+		for row in params.get("products", []):
+			product = self.products[row["id"]-1]
+			price = 0
+			for entry in product["prices"]:
+				if entry["person_group_id"] == person["person_group_id"]:
+					price = entry["amount"]
+			rows.append({"description": product["name"], "price": price, "amount": row["amount"]})
+		for row in params.get("other", []):
+			rows.append({"description": row["description"], "price": row["price"], "amount": row["amount"]})
+		total = sum(row["price"] * row["amount"] for row in rows)
+		person["balance"] -= total
+		invoice = {"id": len(self.invoices)+1, "person_id": person["id"], "timestamp": int(time.time()), "total": total, "rows": rows}
+		self.invoices.append(invoice)
+		return {"invoice": invoice, "person": person, "rows": rows}
+
+	def invoiceListLast(self, params):
+		if isinstance(params, dict):
+			person = params["query"]["person_id"]
+			invoices = [invoice for invoice in self.invoices if invoice["person_id"] == person]
+			return invoices[-params["amount"]:]
+		return self.invoices[-params:]
+
+	def call(self, request):
+		id = request.get("id")
+		method = request.get("method")
+		if not method in self.methods:
+			return {"jsonrpc": "2.0", "id": id, "error": {"code": -32601, "message": "Method not found"}}
+		if not method in ("ping", "session/create") and not request.get("token") in self.sessions:
+			return {"jsonrpc": "2.0", "id": id, "error": {"code": -32001, "message": "Access denied"}}
+		with self.lock:
+			result = self.methods[method](request.get("params"))
+		return {"jsonrpc": "2.0", "id": id, "result": result}
+
+def handler(backend, latency):
+	class Handler(BaseHTTPRequestHandler):
+		protocol_version = "HTTP/1.1" # Keep-alive
+		wbufsize = -1 # Send headers and body in one segment, avoids delayed-ACK stalls
+
+		def do_POST(self):
+			request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+			if latency > 0:
+				time.sleep(latency)
+			if isinstance(request, list):
+				response = [backend.call(call) for call in request]
+			else:
+				response = backend.call(request)
+			body = json.dumps(response).encode("utf-8")
+			self.send_response(200)
+			self.send_header("Content-Type", "application/json")
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, *args):
+			pass
+	return Handler
+
+def serve(port=0, products=1000, persons=200, latency=0.0):
+	# Starts the server on a background thread and returns it; port 0 picks a free port
+	backend = Backend(products, persons)
+	server = ThreadingHTTPServer(("127.0.0.1", port), handler(backend, latency))
+	server.daemon_threads = True
+	server.backend = backend
+	threading.Thread(target=server.serve_forever, name="server", daemon=True).start()
+	return server
+
+def options(argv, defaults):
+	values = dict(defaults)
+	for arg in argv:
+		if arg.startswith("--") and "=" in arg:
+			name, value = arg[2:].split("=", 1)
+			if name in values:
+				values[name] = type(defaults[name])(value)
+	return values
+
+if __name__ == '__main__':
+	opts = options(sys.argv[1:], {"port": 8000, "products": 1000, "persons": 200, "latency": 0.0})
+	server = serve(opts["port"], opts["products"], opts["persons"], opts["latency"])
+	print("Listening on http://127.0.0.1:{}/".format(server.server_address[1]))
+	try:
+		while True:
+			time.sleep(3600)
+	except KeyboardInterrupt:
+		server.shutdown()
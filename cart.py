@@ -0,0 +1,148 @@
+import threading
+from array import array
+
+# Price arrays are indexed by a slot per person group, shared by all products
+_slots = {}
+_lock = threading.Lock() # Products are converted on the catalog and completion threads as well
+MISSING = -(2**63) # No price for this group
+
+def slot(group_id):
+	index = _slots.get(group_id, None)
+	if index != None:
+		return index
+	with _lock:
+		if not group_id in _slots:
+			_slots[group_id] = len(_slots)
+		return _slots[group_id]
+
+class Product:
+	__slots__ = ("id", "name", "active", "package", "identifiers", "prices")
+
+	def __init__(self, id, name, active=True, package=None, identifiers=(), prices=None):
+		self.id = id
+		self.name = name
+		self.active = active
+		self.package = package
+		self.identifiers = identifiers
+		self.prices = prices if prices != None else array("q")
+
+	@classmethod
+	def fromDict(cls, product):
+		prices = array("q")
+		for entry in product.get("prices", None) or []:
+			index = slot(entry["person_group_id"])
+			if index >= len(prices):
+				prices.extend([MISSING] * (index + 1 - len(prices)))
+			prices[index] = entry["amount"]
+		identifiers = []
+		for identifier in product.get("identifiers", None) or []:
+			if isinstance(identifier, dict):
+				identifier = identifier.get("value", None)
+			if identifier != None:
+				identifiers.append(str(identifier))
+		return cls(product["id"], product["name"], product.get("active", True), product.get("package", None), tuple(identifiers), prices)
+
+	def toDict(self):
+		# Inverse of fromDict, in the server's format
+		prices = []
+		for group_id, index in list(_slots.items()):
+			if index < len(self.prices) and self.prices[index] != MISSING:
+				prices.append({"person_group_id": group_id, "amount": self.prices[index]})
+		identifiers = [{"value": identifier} for identifier in self.identifiers]
+		return {"id": self.id, "name": self.name, "active": self.active, "package": self.package, "identifiers": identifiers, "prices": prices}
+
+	def price(self, group_id):
+		# Price in cents for the given person group, None when the product has no price for it
+		index = _slots.get(group_id, None)
+		if index == None or index >= len(self.prices) or self.prices[index] == MISSING:
+			return None
+		return self.prices[index]
+
+	def setPrice(self, group_id, amount):
+		index = slot(group_id)
+		if index >= len(self.prices):
+			self.prices.extend([MISSING] * (index + 1 - len(self.prices)))
+		self.prices[index] = amount
+
+class CartLine:
+	__slots__ = ("product", "amount")
+
+	def __init__(self, product, amount=1):
+		self.product = product
+		self.amount = amount
+
+class Cart:
+	# Cart lines keyed by product id, with the total per person group kept up to date on every change
+	def __init__(self):
+		self.clear()
+
+	def __len__(self):
+		return len(self._lines)
+
+	def __iter__(self):
+		return iter(list(self._lines.values()))
+
+	def __contains__(self, product_id):
+		return product_id in self._lines
+
+	def get(self, product_id):
+		return self._lines.get(product_id, None)
+
+	def _widen(self):
+		# A person group appeared that the totals don't cover yet: recount once at the new width
+		self._totals = array("q", [0] * len(_slots))
+		self._missing = array("l", [0] * len(_slots)) # Lines without a price for the group, the total is unknown while > 0
+		for line in self._lines.values():
+			self._account(line.product, line.amount, 1)
+
+	def _account(self, product, amount, lines=0):
+		# Adds amount units of product to the per-group totals (amount may be negative),
+		# lines is +1 or -1 when the product's cart line is added or removed
+		prices = product.prices
+		for index in range(len(self._totals)):
+			price = prices[index] if index < len(prices) else MISSING
+			if price == MISSING:
+				self._missing[index] += lines
+			else:
+				self._totals[index] += price * amount
+
+	def add(self, product, amount=1):
+		line = self._lines.get(product.id, None)
+		if line != None:
+			self.setAmount(product.id, line.amount + amount)
+			return
+		self._lines[product.id] = CartLine(product, amount)
+		if len(self._totals) < len(_slots):
+			self._widen()
+		else:
+			self._account(product, amount, 1)
+
+	def setAmount(self, product_id, amount):
+		line = self._lines[product_id]
+		if amount == 0:
+			self.remove(product_id)
+			return
+		# The line stays in the cart, only its contribution to the totals changes
+		self._account(line.product, amount - line.amount)
+		line.amount = amount
+
+	def remove(self, product_id):
+		line = self._lines.pop(product_id, None)
+		if line != None:
+			self._account(line.product, -line.amount, -1)
+
+	def clear(self):
+		self._lines = {}
+		self._totals = array("q")
+		self._missing = array("l")
+
+	def total(self, group_id):
+		# Total in cents for the given person group, None when a product in the cart has no price for it
+		index = _slots.get(group_id, None)
+		if index == None:
+			return None
+		if index >= len(self._totals):
+			self._widen()
+		if self._missing[index] > 0:
+			return None
+		return self._totals[index]
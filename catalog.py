@@ -0,0 +1,76 @@
+import time
+
+from cart import Product
+
+def normalize(name):
+	return " ".join(name.lower().split())
+
+class GroupRegistry:
+	# Caches the list of person groups, which rarely changes
+	def __init__(self, client, ttl=600):
+		self._client = client
+		self._ttl = ttl
+		self._groups = None
+		self._fetched = 0
+
+	def list(self):
+		if self._groups == None or time.time() - self._fetched > self._ttl:
+			try:
+				self._groups = self._client.getGroups()
+				self._fetched = time.time()
+			except IOError:
+				# Server unreachable: an outdated list is better than none
+				if self._groups == None:
+					return []
+		return self._groups
+
+	def invalidate(self):
+		self._groups = None
+
+class ProductCatalog:
+	# In-memory copy of the product list, indexed by identifier (barcode) and by name
+	def __init__(self, client):
+		self._client = client
+		self._products = {}
+		self._byIdentifier = {}
+		self._byName = {}
+		self.loaded = 0
+
+	def update(self, products):
+		byId = {}
+		byIdentifier = {}
+		byName = {}
+		for product in products:
+			if not product.get("active", True):
+				continue
+			product = Product.fromDict(product)
+			byId[product.id] = product
+			for identifier in product.identifiers:
+				byIdentifier.setdefault(identifier, []).append(product)
+			byName.setdefault(normalize(product.name), []).append(product)
+		# Swap the indexes in one go so lookups from other threads never see a half-built catalog
+		self._products, self._byIdentifier, self._byName = byId, byIdentifier, byName
+		self.loaded = time.time()
+
+	def load(self):
+		# Products are indexed as they stream in, the complete list is never held in memory
+		self.update(self._client.iter_products())
+
+	def products(self):
+		return list(self._products.values())
+
+	def get(self, id):
+		return self._products.get(id, None)
+
+	def findByIdentifier(self, identifier):
+		return list(self._byIdentifier.get(identifier.strip(), []))
+
+	def findByName(self, name):
+		return list(self._byName.get(normalize(name), []))
+
+	def find(self, query):
+		# Returns an empty list on a miss; callers should then ask the server
+		results = self.findByIdentifier(query)
+		if len(results) < 1:
+			results = self.findByName(query)
+		return results
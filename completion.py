@@ -0,0 +1,92 @@
+import bisect, re, heapq, threading
+
+class CompletionIndex:
+	# Sorted, de-duplicated list of names for prefix lookups with bisect
+	def __init__(self, names=[], presorted=False):
+		if presorted:
+			self._names = list(names)
+		else:
+			self._names = sorted(set(names))
+		# All names in one string so fuzzy matching runs as a single regex scan
+		self._blob = "\n".join(self._names)
+		self._offsets = []
+		offset = 0
+		for name in self._names:
+			self._offsets.append(offset)
+			offset += len(name) + 1
+
+	def changed(self, added, removed):
+		# Returns a new index with the given names added and removed, merging instead of re-sorting everything
+		names = [name for name in self._names if not name in removed]
+		return CompletionIndex(heapq.merge(names, sorted(added)), True)
+
+	def __len__(self):
+		return len(self._names)
+
+	def names(self):
+		return self._names
+
+	def complete(self, prefix, limit=None):
+		names = self._names
+		lo = bisect.bisect_left(names, prefix)
+		if len(prefix) > 0:
+			hi = bisect.bisect_left(names, prefix[:-1] + chr(ord(prefix[-1]) + 1), lo)
+		else:
+			hi = len(names)
+		if limit != None:
+			hi = min(hi, lo + limit)
+		return names[lo:hi]
+
+	def fuzzy(self, query, limit=20):
+		# Subsequence match, ranked by how tightly and how early the characters of the query occur
+		if len(query) < 1:
+			return []
+		pattern = re.compile("[^\n]*?".join(re.escape(c) for c in query))
+		ranked = {}
+		for match in pattern.finditer(self._blob):
+			index = bisect.bisect_right(self._offsets, match.start()) - 1
+			name = self._names[index]
+			entry = (match.end() - match.start(), match.start() - self._offsets[index], len(name), name)
+			if not name in ranked or entry < ranked[name]:
+				ranked[name] = entry
+		ranked = list(ranked.values())
+		ranked.sort()
+		return [entry[3] for entry in ranked[:limit]]
+
+class CompletionRefresher:
+	# Keeps a CompletionIndex up to date from a background thread
+	def __init__(self, source, interval=300):
+		self._source = source
+		self._interval = interval
+		self._snapshot = set()
+		self._stop = threading.Event()
+		self._thread = None
+		self.index = CompletionIndex()
+		self.ready = threading.Event()
+
+	def refresh(self):
+		names = set(self._source())
+		added = names - self._snapshot
+		removed = self._snapshot - names
+		if len(added) > 0 or len(removed) > 0:
+			# Readers keep using the old index until this assignment
+			self.index = self.index.changed(added, removed)
+			self._snapshot = names
+		self.ready.set()
+
+	def _run(self):
+		while True:
+			try:
+				self.refresh()
+			except Exception:
+				pass # Keep the previous index, try again next time
+			if self._stop.wait(self._interval):
+				return
+
+	def start(self):
+		if self._thread == None:
+			self._thread = threading.Thread(target=self._run, name="completion", daemon=True)
+			self._thread.start()
+
+	def stop(self):
+		self._stop.set()
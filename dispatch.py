@@ -0,0 +1,29 @@
+class InputClassifier:
+	# Decides locally what a line of input is, so only the lookup that can succeed goes to the server
+	PERSON = "person"
+	PRODUCT = "product"
+	BARCODE = "barcode" # Looks like a product barcode, but the catalog doesn't know it (yet)
+	UNKNOWN = "unknown"
+
+	# EAN-8, UPC-A, EAN-13 and GTIN-14
+	BARCODE_LENGTHS = (8, 12, 13, 14)
+
+	def __init__(self, catalog):
+		self._catalog = catalog
+		self._nicknames = frozenset()
+
+	def setNicknames(self, nicknames):
+		self._nicknames = frozenset(nickname.lower() for nickname in nicknames)
+
+	def classify(self, line):
+		if len(self._catalog.findByIdentifier(line)) > 0:
+			return self.PRODUCT
+		if line.strip().lower() in self._nicknames:
+			return self.PERSON
+		if len(self._catalog.findByName(line)) > 0:
+			return self.PRODUCT
+		line = line.strip()
+		if line.isdigit() and len(line) in self.BARCODE_LENGTHS:
+			# A scan of a product added since the catalog was loaded: only the server's product search can find it
+			return self.BARCODE
+		return self.UNKNOWN
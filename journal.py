@@ -0,0 +1,117 @@
+import json, os, threading, time, uuid
+
+from protocol import ApiError
+
+class TransactionJournal:
+	# Append-only, fsync'ed log of transactions made while the server was unreachable.
+	# Each transaction is written as an "invoice" record and later closed by a "done" or "failed" record.
+	def __init__(self, path="spacecore-cli.journal"):
+		self._path = path
+		self._lock = threading.Lock()
+		self._pending = []
+		self._failed = []
+		if os.path.exists(path):
+			self._load()
+		self._file = open(path, 'a')
+
+	def _load(self):
+		entries = {}
+		order = []
+		complete = 0 # Offset just past the last complete line
+		with open(self._path, 'rb') as f:
+			for line in f:
+				if not line.endswith(b"\n"):
+					break # Torn write at the end of the file
+				complete += len(line)
+				try:
+					record = json.loads(line.decode("utf-8"))
+				except ValueError:
+					continue
+				if record["type"] == "invoice":
+					entries[record["key"]] = record
+					order.append(record["key"])
+				elif record["key"] in entries:
+					del entries[record["key"]]
+		self._pending = [entries[key] for key in order if key in entries]
+		if complete < os.path.getsize(self._path):
+			# Cut the torn line off, otherwise the next record would be appended to it and lost
+			with open(self._path, 'r+b') as f:
+				f.truncate(complete)
+				os.fsync(f.fileno())
+
+	def _write(self, record):
+		self._file.write(json.dumps(record)+"\n")
+		self._file.flush()
+		os.fsync(self._file.fileno())
+
+	def newKey(self):
+		return str(uuid.uuid4())
+
+	def append(self, person, products=[], other=[], total=None, key=None):
+		record = {
+			"type": "invoice",
+			"key": key or self.newKey(),
+			"timestamp": time.time(),
+			"person_id": person["id"],
+			"nick_name": person["nick_name"],
+			"products": products,
+			"other": other,
+			"total": total
+		}
+		with self._lock:
+			self._write(record)
+			self._pending.append(record)
+		return record
+
+	def pending(self):
+		return len(self._pending)
+
+	def poll(self):
+		# Returns the (record, error) pairs the server rejected since the last call
+		with self._lock:
+			failed = self._failed
+			self._failed = []
+		return failed
+
+	def replay(self, client):
+		# Sends the pending transactions in order; stops at the first error that is not a rejection by the server so ordering is kept
+		while True:
+			with self._lock:
+				if len(self._pending) < 1:
+					break
+				record = self._pending[0]
+			try:
+				client.invoiceExecute(record["person_id"], record["products"], record["other"], record["key"])
+				done = {"type": "done", "key": record["key"]}
+			except ApiError as e:
+				if not e.fromServer or e.code == -32001:
+					raise # Not a rejection of this transaction, keep it and try again later
+				done = {"type": "failed", "key": record["key"], "error": str(e)}
+				with self._lock:
+					self._failed.append((record, e))
+			with self._lock:
+				self._write(done)
+				self._pending.pop(0)
+		self._compact()
+
+	def _compact(self):
+		# Once everything is replayed the log can start over
+		with self._lock:
+			if len(self._pending) > 0:
+				return
+			self._file.close()
+			self._file = open(self._path, 'w')
+			os.fsync(self._file.fileno())
+
+	def start(self, client, monitor, interval=5):
+		def run():
+			while True:
+				monitor.wait()
+				if self.pending() > 0:
+					try:
+						self.replay(client)
+					except Exception:
+						# Anything but a rejection by the server (connection loss, a proxy error page...) is retried
+						monitor.markDown()
+				time.sleep(interval)
+		threading.Thread(target=run, name="journal", daemon=True).start()
@@ -0,0 +1,54 @@
+import threading
+
+class HealthMonitor:
+	# Pings the server from a background thread so commands don't have to
+	def __init__(self, client, interval=10, minBackoff=1, maxBackoff=30):
+		self._client = client
+		self._interval = interval
+		self._minBackoff = minBackoff
+		self._maxBackoff = maxBackoff
+		self._up = threading.Event()
+		self._wake = threading.Event()
+		self._thread = None
+		self._running = False
+
+	@property
+	def is_up(self):
+		return self._up.is_set()
+
+	def check(self):
+		if self._client.ping():
+			self._up.set()
+		else:
+			self._up.clear()
+		return self._up.is_set()
+
+	def markDown(self):
+		# Called when a request fails so the monitor starts probing right away
+		self._up.clear()
+		self._wake.set()
+
+	def wait(self, timeout=None):
+		return self._up.wait(timeout)
+
+	def _run(self):
+		backoff = self._minBackoff
+		while self._running:
+			if self.check():
+				backoff = self._minBackoff
+				delay = self._interval
+			else:
+				delay = backoff
+				backoff = min(backoff * 2, self._maxBackoff)
+			self._wake.wait(delay)
+			self._wake.clear()
+
+	def start(self):
+		if self._thread == None:
+			self._running = True
+			self._thread = threading.Thread(target=self._run, name="monitor", daemon=True)
+			self._thread.start()
+
+	def stop(self):
+		self._running = False
+		self._wake.set()
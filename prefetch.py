@@ -0,0 +1,34 @@
+import threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+class Prefetcher:
+	# Starts requests before their results are needed. Requests for the same key share one
+	# future, so a lookup that is already in flight is never sent twice
+	def __init__(self, workers=2, ttl=15):
+		self._executor = ThreadPoolExecutor(workers, "prefetch")
+		self._ttl = ttl
+		self._lock = threading.Lock()
+		self._cache = {}
+
+	def prefetch(self, key, function, *args):
+		with self._lock:
+			entry = self._cache.get(key, None)
+			if entry != None:
+				future, started = entry
+				if time.time() - started < self._ttl and not (future.done() and future.exception() != None):
+					return future
+			future = self._executor.submit(function, *args)
+			self._cache[key] = (future, time.time())
+			return future
+
+	def get(self, key, function, *args):
+		# Returns the prefetched result, or fetches it now (sharing any request already in flight)
+		return self.prefetch(key, function, *args).result()
+
+	def invalidate(self, key):
+		with self._lock:
+			self._cache.pop(key, None)
+
+	def clear(self):
+		with self._lock:
+			self._cache = {}
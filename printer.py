@@ -1,7 +1,12 @@
-import serial
-from PIL import Image, ImageOps
+import serial, os, hashlib, time, stats
+from contextlib import contextmanager
 import six
 
+try:
+	import numpy
+except ImportError:
+	numpy = None # Images are converted with PIL only
+
 class ReceiptPrinter:
 	ALIGN_LEFT = 0
 	ALIGN_CENTER = 1
@@ -27,9 +32,21 @@ class ReceiptPrinter:
 	def _to_column_format(self, im, line_height):
 		"""
 		Extract slices of an image as equal-sized blobs of column-format data.
+		Uses NumPy when it is installed and falls back on PIL otherwise.
+		:param im: Image to extract from
+		:param line_height: Printed line height in dots
+		"""
+		if numpy == None:
+			return self._to_column_format_pil(im, line_height)
+		return self._to_column_format_numpy(im, line_height)
+
+	def _to_column_format_pil(self, im, line_height):
+		"""
+		Extract slices of an image as equal-sized blobs of column-format data, one PIL transform per slice.
 		:param im: Image to extract from
 		:param line_height: Printed line height in dots
 		"""
+		from PIL import Image
 		width_pixels, height_pixels = im.size
 		top = 0
 		left = 0
@@ -43,6 +60,20 @@ class ReceiptPrinter:
 			left += line_height
 		return blobs
 
+	def _to_column_format_numpy(self, im, line_height):
+		"""
+		Extract slices of an image as equal-sized blobs of column-format data, packing all slices at once.
+		:param im: 1-bit image to extract from
+		:param line_height: Printed line height in dots, a multiple of 8
+		"""
+		width_pixels, height_pixels = im.size
+		slices = -(-width_pixels // line_height)
+		pixels = numpy.zeros((height_pixels, slices * line_height), dtype=bool)
+		pixels[:, :width_pixels] = numpy.asarray(im.convert("1"), dtype=bool)
+		# (rows, slices, dots) -> (slices, rows, dots), then pack each row of dots MSB first like PIL's tobytes()
+		packed = numpy.packbits(pixels.reshape(height_pixels, slices, line_height).transpose(1, 0, 2), axis=2)
+		return [packed[i].tobytes() for i in range(slices)]
+
 	def _int_low_high(self, inp_number, out_bytes):
 		""" Generate multiple bytes for a number: In lower and higher parts, or more parts as needed.
 		
@@ -60,7 +91,7 @@ class ReceiptPrinter:
 			inp_number = inp_number // 256
 		return outp
 
-	def __init__(self, kodak=False, device="/dev/ttyUSB0"):
+	def __init__(self, kodak=False, device="/dev/ttyUSB0", cache_dir=".rastercache", chunk_size=4096, chunk_delay=0):
 		self.serial = serial.Serial(
 			port=device,
 			baudrate=19200,
@@ -68,12 +99,52 @@ class ReceiptPrinter:
 			bytesize=serial.EIGHTBITS)
 		self.encoding = 'ascii'
 		self.kodak = kodak
+		self.cache_dir = cache_dir
+		self._raster_cache = {}
+		self.chunk_size = chunk_size
+		self.chunk_delay = chunk_delay
+		self._buffer = None
 		self.init()
 
 	def output(self, *data):
 		# print(repr(data))
 		for block in data:
-			self.serial.write(block)
+			if isinstance(block, int):
+				block = bytes([block])
+			if self._buffer != None:
+				self._buffer += block
+			else:
+				self.serial.write(block)
+
+	def flush(self):
+		""" Write out everything collected by job() in large chunks.
+		"""
+		if not self._buffer:
+			return
+		start = time.perf_counter()
+		view = memoryview(self._buffer)
+		for offset in range(0, len(view), self.chunk_size):
+			if offset > 0 and self.chunk_delay:
+				time.sleep(self.chunk_delay) # Give the printer time to empty its input buffer
+			self.serial.write(view[offset:offset+self.chunk_size])
+		self.serial.flush() # Wait until everything is sent, so the timing covers the transfer
+		view.release()
+		stats.record("printer write", time.perf_counter() - start, len(self._buffer))
+		self._buffer = bytearray()
+
+	@contextmanager
+	def job(self):
+		""" Collect all output inside the with block and send it as a few large writes.
+		"""
+		if self._buffer != None:
+			yield self # Nested job: the outer job flushes
+			return
+		self._buffer = bytearray()
+		try:
+			yield self
+			self.flush()
+		finally:
+			self._buffer = None
 
 	def init(self):
 		if self.kodak:
@@ -91,9 +162,12 @@ class ReceiptPrinter:
 	def set_align(self, align):
 		self.output(self.CMD_ESC, b'a', bytes([align]))
 
-	def print_image(self, filename):
-		high_density_horizontal = True
-		high_density_vertical = True
+	def _render_image(self, filename, high_density_horizontal, high_density_vertical):
+		""" Convert an image into the ESC/POS byte stream that prints it.
+		
+		:param filename: Path of the image
+		"""
+		from PIL import Image, ImageOps
 		im = Image.open(filename)
 		im = im.convert("L")  # Invert: Only works on 'L' images
 		im = ImageOps.invert(im) # Bits are sent with 0 = white, 1 = black in ESC/POS
@@ -105,11 +179,46 @@ class ReceiptPrinter:
 		density_byte = (1 if high_density_horizontal else 0) + (32 if high_density_vertical else 0);
 		header = self.CMD_ESC + b"*" + six.int2byte(density_byte) + self._int_low_high( width_pixels, 2 );
 		
-		self.set_align(self.ALIGN_CENTER)
-		self.output(self.CMD_ESC, b'3', six.int2byte(16))
+		data = bytearray()
+		data += self.CMD_ESC + b'a' + bytes([self.ALIGN_CENTER])
+		data += self.CMD_ESC + b'3' + six.int2byte(16)
 		for blob in blobs:
-			self.output(header, blob, b'\n')
-		self.output(self.CMD_ESC, bytes([ord('2')]))
+			data += header + blob + b'\n'
+		data += self.CMD_ESC + bytes([ord('2')])
+		return bytes(data)
+
+	def _raster(self, filename, high_density_horizontal, high_density_vertical):
+		""" Return the ESC/POS byte stream for an image, from memory or disk when possible.
+		
+		:param filename: Path of the image
+		"""
+		key = (os.path.abspath(filename), os.path.getmtime(filename), high_density_horizontal, high_density_vertical)
+		if key in self._raster_cache:
+			return self._raster_cache[key]
+		cache_file = None
+		if self.cache_dir:
+			cache_file = os.path.join(self.cache_dir, hashlib.sha1(repr(key).encode()).hexdigest()+".bin")
+			try:
+				with open(cache_file, 'rb') as f:
+					data = f.read()
+				self._raster_cache[key] = data
+				return data
+			except IOError:
+				pass
+		data = self._render_image(filename, high_density_horizontal, high_density_vertical)
+		self._raster_cache[key] = data
+		if cache_file:
+			try:
+				os.makedirs(self.cache_dir, exist_ok=True)
+				with open(cache_file+".tmp", 'wb') as f:
+					f.write(data)
+				os.replace(cache_file+".tmp", cache_file)
+			except OSError:
+				pass
+		return data
+
+	def print_image(self, filename, high_density_horizontal=True, high_density_vertical=True):
+		self.output(self._raster(filename, high_density_horizontal, high_density_vertical))
 		
 	def writeline(self, data=None):
 		if data:
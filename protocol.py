@@ -1,11 +1,13 @@
-import requests, time
+import requests, time, asyncio, functools, itertools, threading, codecs, stats
+from json import JSONDecoder
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 try:
 	import ujson as json
 	print("(Using ujson)")
 except:
 	print("(Please install ujson! Falling back on the slow built in json library)")
-	time.sleep(2)
 	import json
 
 class ApiError(Exception):
@@ -18,40 +20,244 @@ class ApiError(Exception):
 			code = error['code']
 		else:
 			code = -1
+		self.code = code
+		self.fromServer = isinstance(error, dict) # False for errors detected on this side, like a malformed response
 		super().__init__(message)
 
+_DELIMITERS = " \t\r\n,]}:"
+
+class _ResultStream:
+	# Incremental parser for a JSON-RPC response whose result is a list: yields the list items one by one
+	# while the body is still being received, without ever holding the complete body or list in memory
+	def __init__(self, chunks, id):
+		self._chunks = iter(chunks)
+		self._decoder = codecs.getincrementaldecoder("utf-8")()
+		self._json = JSONDecoder()
+		self._buffer = ""
+		self._pos = 0
+		self._id = id
+		self.bytes = 0
+
+	def _more(self):
+		for chunk in self._chunks:
+			if chunk:
+				self.bytes += len(chunk)
+				self._buffer = self._buffer[self._pos:] + self._decoder.decode(chunk)
+				self._pos = 0
+				return True
+		return False
+
+	def _peek(self):
+		# Returns the next non-whitespace character without consuming it
+		while True:
+			while self._pos < len(self._buffer) and self._buffer[self._pos] in " \t\r\n":
+				self._pos += 1
+			if self._pos < len(self._buffer):
+				return self._buffer[self._pos]
+			if not self._more():
+				raise ApiError("Invalid response")
+
+	def _expect(self, characters):
+		char = self._peek()
+		if not char in characters:
+			raise ApiError("Invalid response")
+		self._pos += 1
+		return char
+
+	def _value(self):
+		self._peek() # Skip whitespace, raw_decode doesn't
+		while True:
+			try:
+				value, end = self._json.raw_decode(self._buffer, self._pos)
+				# A value may be cut off at the end of the buffer ("1500." parses as 1500), only accept it once a delimiter follows
+				if end < len(self._buffer) and self._buffer[end] in _DELIMITERS:
+					self._pos = end
+					return value
+			except ValueError:
+				pass
+			if not self._more():
+				value, self._pos = self._json.raw_decode(self._buffer, self._pos)
+				return value
+
+	def __iter__(self):
+		self._expect("{")
+		if self._peek() == "}":
+			return
+		while True:
+			key = self._value()
+			self._expect(":")
+			if key == "result" and self._peek() == "[":
+				self._pos += 1
+				if self._peek() == "]":
+					self._pos += 1
+				else:
+					while True:
+						yield self._value()
+						if self._expect(",]") == "]":
+							break
+			else:
+				value = self._value()
+				if key == "error":
+					raise ApiError(value)
+				if key == "id" and value != self._id:
+					raise ApiError("API returned incorrect id!")
+				if key == "result" and value != None:
+					raise ApiError("Invalid response")
+			if self._expect(",}") == "}":
+				return
+
 class RpcClient:
-	def __init__(self, uri="http://127.0.0.1:8000"):
+	def __init__(self, uri="http://127.0.0.1:8000", poolSize=4, connectTimeout=3.05, readTimeout=10):
 		self._uri = uri
 		self._session = None
 		self.user = None
 		
 		self._username = ""
 		self._password = ""
+		
+		# Long-lived HTTP transport: keeps the TCP (and TLS) connection to the server open between calls
+		self._timeout = (connectTimeout, readTimeout)
+		self._http = requests.Session()
+		self._http.headers.update({"Connection": "keep-alive"})
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=poolSize, pool_block=False)
+		self._http.mount("http://", adapter)
+		self._http.mount("https://", adapter)
+		
+		# Request ids are unique per client, so responses can always be matched to the call that caused them
+		self._ids = itertools.count(1)
+		self._lock = threading.Lock()
+		
+		# Session bookkeeping, see refreshSession() and SessionManager
+		self._sessionLock = threading.RLock()
+		self.sessionCreated = None
+		self.onSession = None # Called without arguments whenever the session token changes
 
-	def _request(self, method, params=None, retry=True):
-		id = round(time.time())
+	def close(self):
+		self._http.close()
+
+	def _call(self, method, params, id, token):
 		data = {"jsonrpc":"2.0", "id": id, "method": method, "params": params}
-		if self._session != None:
-			data["token"] = self._session
-		request = requests.post(self._uri, json=data)
-		data = json.loads(request.text)
-		if (not 'id' in data) or (data['id']!=id):
-			print("DEBUG",data)
+		if token:
+			data["token"] = token
+		return data
+
+	def _reconnect(self, token):
+		# Single flight: when several requests see the session expire, only the first one creates a new session
+		with self._sessionLock:
+			if self._session != token:
+				return
+			print("\u001b[33mSession interrupted. Connecting...\u001b[39m")
+			try:
+				self.refreshSession()
+			except ApiError as e:
+				print("Could not create session:",e)
+
+	def _send(self, calls, token=None):
+		# Posts one or more (method, params) calls and returns their responses in call order (None when missing)
+		if token == None:
+			token = self._session
+		with self._lock:
+			ids = [next(self._ids) for call in calls]
+		data = [self._call(method, params, id, token) for id, (method, params) in zip(ids, calls)]
+		if len(calls) == 1:
+			name = "rpc "+calls[0][0]
+		else:
+			name = "rpc batch["+",".join(method for method, params in calls)+"]"
+		body = json.dumps(data[0] if len(data) == 1 else data).encode("utf-8")
+		start = time.perf_counter()
+		try:
+			request = self._http.post(self._uri, data=body, headers={"Content-Type": "application/json"}, timeout=self._timeout)
+			content = request.content
+			data = json.loads(content.decode("utf-8"))
+		except:
+			stats.record(name, time.perf_counter() - start, len(body), 0, True)
+			raise
+		if not isinstance(data, list):
+			data = [data]
+		errors = any(isinstance(response, dict) and 'error' in response for response in data)
+		stats.record(name, time.perf_counter() - start, len(body), len(content), errors)
+		# Correlation table: request id -> response
+		responses = dict.fromkeys(ids)
+		for response in data:
+			if (not isinstance(response, dict)) or (response.get('jsonrpc')!="2.0"):
+				raise ApiError("Invalid response")
+			if not response.get('id') in responses:
+				if 'error' in response:
+					raise ApiError(response['error'])
+				print("DEBUG",response)
+				raise ApiError("API returned incorrect id!")
+			responses[response['id']] = response
+		return [responses[id] for id in ids]
+
+	def _result(self, response):
+		if response == None:
 			raise ApiError("API returned incorrect id!")
-		if (data['jsonrpc']!="2.0"):
-			raise ApiError("Invalid response")
-		if 'error' in data:
-			#print("ERROR", data['error'])
-			if retry and data['error']['code'] == -32001: #Access denied
-				print("\u001b[33mSession interrupted. Connecting...\u001b[39m")
-				self.createSession()
-				self.login(self._username, self._password)
-				return self._request(method, params, False)
-			raise ApiError(data['error'])
-		if 'result' in data:
-			return data['result']
-		return None
+		if 'error' in response:
+			raise ApiError(response['error'])
+		return response.get('result')
+
+	def _expired(self, response):
+		return response != None and 'error' in response and response['error'].get('code') == -32001 #Access denied
+
+	def _request(self, method, params=None, retry=True):
+		token = self._session
+		response = self._send([(method, params)], token)[0]
+		if retry and self._expired(response):
+			self._reconnect(token)
+			return self._request(method, params, False)
+		return self._result(response)
+
+	def batch(self, calls, retry=True):
+		# Sends a list of (method, params) tuples as a single JSON-RPC batch
+		# and returns the results in the same order as the calls
+		if len(calls) < 1:
+			return []
+		token = self._session
+		responses = self._send(calls, token)
+		if retry and any(self._expired(response) for response in responses):
+			self._reconnect(token)
+			return self.batch(calls, False)
+		return [self._result(response) for response in responses]
+
+	def _iterRequest(self, method, params=None, fields=None, retry=True):
+		# Streams the list returned by method, optionally keeping only the given fields of every item
+		with self._lock:
+			id = next(self._ids)
+		token = self._session
+		body = json.dumps(self._call(method, params, id, token)).encode("utf-8")
+		start = time.perf_counter()
+		stream = None
+		error = True
+		expired = False
+		try:
+			with self._http.post(self._uri, data=body, headers={"Content-Type": "application/json"}, timeout=self._timeout, stream=True) as request:
+				stream = _ResultStream(request.iter_content(65536), id)
+				first = True
+				try:
+					for item in stream:
+						first = False
+						if fields != None:
+							item = {field: item[field] for field in fields if field in item}
+						yield item
+				except ApiError as e:
+					if not (first and retry and e.code == -32001): #Access denied
+						raise
+					expired = True
+			error = expired
+		finally:
+			stats.record("rpc stream "+method, time.perf_counter() - start, len(body), stream.bytes if stream else 0, error)
+		if expired:
+			self._reconnect(token)
+			yield from self._iterRequest(method, params, fields, False)
+
+	def find(self, query):
+		# Looks up a query as person and as product in a single round trip
+		person, byIdentifier, byName = self.batch([
+			("person/findForVending", query),
+			("product/findByIdentifier", query),
+			("product/find", query)
+		])
+		return person, self._activeProducts(byIdentifier) + self._activeProducts(byName)
 
 	# PING MODULE
 
@@ -67,17 +273,53 @@ class RpcClient:
 
 	def createSession(self):
 		try:
-			self._session = self._request("session/create")
+			with self._sessionLock:
+				self._session = self._request("session/create")
+				self.sessionCreated = time.time()
 			return True
 		except ApiError as e:
 			print("Could not create session:",e)
 			return False
 
+	def refreshSession(self):
+		# Creates and authenticates a new session next to the current one, then swaps it in,
+		# so requests in flight keep working with the old token
+		token = self._result(self._send([("session/create", None)], "")[0])
+		user = self._result(self._send([("user/authenticate", {"user_name": self._username, "password": self._password})], token)[0])
+		with self._sessionLock:
+			self._session = token
+			self.user = user
+			self.sessionCreated = time.time()
+		self._sessionChanged()
+
+	def _sessionChanged(self):
+		if self.onSession != None:
+			self.onSession()
+
+	def restoreSession(self, token, created, user, username, password):
+		# Reuses a session from an earlier run. It is not checked here: if the server no longer
+		# knows the token, the first request re-authenticates with the given credentials
+		with self._sessionLock:
+			self._session = token
+			self.sessionCreated = created
+			self.user = user
+			self._username = username
+			self._password = password
+
+	def sessionToken(self):
+		return self._session
+
+	def sessionAge(self):
+		if self.sessionCreated == None:
+			return None
+		return time.time() - self.sessionCreated
+
 	def login(self, username, password):
 		self._username = username
 		self._password = password
 		try:
 			self.user = self._request("user/authenticate", {"user_name": username, "password": password})
+			self._sessionChanged()
 			return True
 		except ApiError as e:
 			print(e)
@@ -94,6 +336,9 @@ class RpcClient:
 	def personList(self, search):
 		return self._request("person/listForVendingNoAvatar", search)
 
+	def iter_persons(self, search={}, fields=None):
+		return self._iterRequest("person/listForVendingNoAvatar", search, fields)
+
 	def personFind(self, search):
 		return self._request("person/findForVending", search)
 
@@ -102,21 +347,25 @@ class RpcClient:
 	def productList(self, query):
 		return self._request("product/list/noimg", query)
 
-	def productFindByName(self, name):
-		results = self._request("product/find", name)
+	def iter_products(self, query={}, fields=None):
+		return self._iterRequest("product/list/noimg", query, fields)
+
+	def _activeProducts(self, results):
 		results_filtered = []
 		for i in results:
 			if i["active"]:
 				results_filtered.append(i)
 		return results_filtered
+
+	def productFindByName(self, name):
+		return self._activeProducts(self._request("product/find", name))
 	
 	def productFindByIdentifier(self, identifier):
-		results = self._request("product/findByIdentifier", identifier)
-		results_filtered = []
-		for i in results:
-			if i["active"]:
-				results_filtered.append(i)
-		return results_filtered
+		return self._activeProducts(self._request("product/findByIdentifier", identifier))
+
+	def productFind(self, query):
+		byIdentifier, byName = self.batch([("product/findByIdentifier", query), ("product/find", query)])
+		return self._activeProducts(byIdentifier) + self._activeProducts(byName)
 		
 	def productSetPrice(self, product, group, price):
 		return self._request("product/price/set", {"product_id":product, "group_id":group, "amount":price})
@@ -132,7 +381,7 @@ class RpcClient:
 	
 	# INVOICE MODULE
 	
-	def invoices(self, person=None, after=None, before=None):
+	def _invoiceQuery(self, person=None, after=None, before=None):
 		query = {}
 		if person != None:
 			query['person_id'] = person
@@ -142,7 +391,13 @@ class RpcClient:
 			query['timestamp'] = {">=": after}
 		elif before != None:
 			query['timestamp'] = {"<=": before}
-		return self._request("invoice/list", query)
+		return query
+
+	def invoices(self, person=None, after=None, before=None):
+		return self._request("invoice/list", self._invoiceQuery(person, after, before))
+
+	def iter_invoices(self, person=None, after=None, before=None, fields=None):
+		return self._iterRequest("invoice/list", self._invoiceQuery(person, after, before), fields)
 	
 	def lastInvoice(self, amount):
 		return self._request("invoice/list/last", amount)
@@ -162,6 +417,31 @@ class RpcClient:
 		transaction = {"person_id": person, "other": other}
 		return self._request("invoice/create", transaction)
 	
-	def invoiceExecute(self, person, products=[], other=[]):
+	def invoiceExecute(self, person, products=[], other=[], key=None):
 		transaction = {"person_id": person, "products": products, "other": other}
+		if key != None:
+			transaction["idempotency_key"] = key # Lets the server drop a replayed transaction it already has
 		return self._request("invoice/create", transaction)
+
+
+class AsyncRpcClient:
+	# Asyncio front-end for RpcClient: every public RpcClient method is available as a coroutine,
+	# at most `limit` requests are in flight at the same time over the client's connection pool
+	def __init__(self, client, limit=4):
+		self.client = client
+		self._executor = ThreadPoolExecutor(limit, "rpc")
+
+	def __getattr__(self, name):
+		method = getattr(self.client, name)
+		if name.startswith("_") or not callable(method):
+			raise AttributeError(name)
+		if name.startswith("iter_"):
+			# Streaming methods are consumed on the worker thread, the coroutine returns a list
+			method = functools.partial(lambda method, *args, **kwargs: list(method(*args, **kwargs)), method)
+		async def call(*args, **kwargs):
+			loop = asyncio.get_running_loop()
+			return await loop.run_in_executor(self._executor, functools.partial(method, *args, **kwargs))
+		return call
+
+	def close(self):
+		self._executor.shutdown(False)
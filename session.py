@@ -0,0 +1,36 @@
+import threading
+
+from protocol import ApiError
+
+class SessionManager:
+	# Replaces the client's session in the background before the server expires it,
+	# so re-authentication never happens in the middle of a checkout
+	def __init__(self, client, lifetime=3600, margin=0.2, retry=30):
+		self._client = client
+		self._lifetime = lifetime
+		self._margin = margin
+		self._retry = retry
+		self._stop = threading.Event()
+		self._thread = None
+
+	def due(self):
+		# Seconds until the session should be refreshed
+		age = self._client.sessionAge()
+		if age == None:
+			return 0
+		return max(0, self._lifetime * (1 - self._margin) - age)
+
+	def _run(self):
+		while not self._stop.wait(self.due()):
+			try:
+				self._client.refreshSession()
+			except (ApiError, IOError):
+				self._stop.wait(self._retry) # Server unreachable, try again later
+
+	def start(self):
+		if self._thread == None:
+			self._thread = threading.Thread(target=self._run, name="session", daemon=True)
+			self._thread.start()
+
+	def stop(self):
+		self._stop.set()
@@ -0,0 +1,71 @@
+import threading, queue, stats
+
+class PrintJob:
+	QUEUED = "queued"
+	PRINTING = "printing"
+	DONE = "done"
+	FAILED = "failed"
+
+	def __init__(self, description, function):
+		self.description = description
+		self.function = function
+		self.status = self.QUEUED
+		self.error = None
+		self.finished = threading.Event()
+
+class PrintSpooler:
+	# Runs print jobs on a worker thread so the shell doesn't wait for the serial link
+	def __init__(self, connect, maxJobs=4):
+		# connect is called on the worker thread to open the printer, so a slow or missing printer never delays startup
+		self._connect = connect
+		self.printer = None
+		self.error = None
+		self.ready = threading.Event()
+		self._queue = queue.Queue(maxJobs)
+		self._lock = threading.Lock()
+		self._finished = []
+		self._thread = threading.Thread(target=self._run, name="spooler", daemon=True)
+		self._thread.start()
+
+	def submit(self, description, function):
+		# function is called with the printer as its only argument; raises queue.Full when the spooler is busy
+		job = PrintJob(description, function)
+		self._queue.put_nowait(job)
+		return job
+
+	def pending(self):
+		return self._queue.qsize()
+
+	def poll(self):
+		# Returns the jobs that finished since the last call
+		with self._lock:
+			finished = self._finished
+			self._finished = []
+		return finished
+
+	@property
+	def available(self):
+		return self.error == None
+
+	def _run(self):
+		try:
+			self.printer = self._connect()
+		except Exception as e:
+			self.error = e
+		self.ready.set()
+		while True:
+			job = self._queue.get()
+			job.status = job.PRINTING
+			try:
+				if self.printer == None:
+					raise IOError("Printer not available: "+str(self.error))
+				with stats.timer("print job"):
+					job.function(self.printer)
+				job.status = job.DONE
+			except Exception as e:
+				job.status = job.FAILED
+				job.error = e
+			with self._lock:
+				self._finished.append(job)
+			job.finished.set()
+			self._queue.task_done()
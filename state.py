@@ -0,0 +1,31 @@
+import json, os, threading
+
+# Session token and catalog snapshot kept between runs, so a restart can skip authentication
+
+_lock = threading.Lock() # Saves come from the session, catalog and completion threads
+
+def load(path):
+	try:
+		with open(path, 'r') as f:
+			return json.load(f)
+	except (IOError, ValueError):
+		return None
+
+def save(path, client, catalog):
+	state = {
+		"uri": client._uri,
+		"token": client.sessionToken(),
+		"created": client.sessionCreated,
+		"user": client.user,
+		"catalog": [product.toDict() for product in catalog.products()]
+	}
+	# Only the owner may read the file: it contains a valid session token
+	temp = path + ".tmp"
+	with _lock:
+		fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+		with os.fdopen(fd, 'w') as f:
+			os.fchmod(f.fileno(), 0o600)
+			json.dump(state, f)
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(temp, path)
@@ -0,0 +1,93 @@
+import threading, time, json, collections
+from contextlib import contextmanager
+
+class Metric:
+	def __init__(self, samples=1000):
+		self.count = 0
+		self.errors = 0
+		self.bytesOut = 0
+		self.bytesIn = 0
+		self.total = 0.0
+		self.latencies = collections.deque(maxlen=samples) # Most recent samples, for the percentiles
+
+	def percentile(self, p):
+		if len(self.latencies) < 1:
+			return 0.0
+		ordered = sorted(self.latencies)
+		return ordered[min(len(ordered)-1, int(round(p/100.0*(len(ordered)-1))))]
+
+	def summary(self):
+		return {
+			"count": self.count,
+			"errors": self.errors,
+			"bytes_out": self.bytesOut,
+			"bytes_in": self.bytesIn,
+			"total": self.total,
+			"p50": self.percentile(50),
+			"p95": self.percentile(95),
+			"p99": self.percentile(99)
+		}
+
+_metrics = {}
+_lock = threading.Lock()
+_started = time.time()
+
+def record(name, seconds, bytesOut=0, bytesIn=0, error=False):
+	with _lock:
+		metric = _metrics.get(name)
+		if metric == None:
+			metric = _metrics[name] = Metric()
+		metric.count += 1
+		metric.total += seconds
+		metric.bytesOut += bytesOut
+		metric.bytesIn += bytesIn
+		if error:
+			metric.errors += 1
+		metric.latencies.append(seconds)
+
+@contextmanager
+def timer(name):
+	start = time.perf_counter()
+	error = False
+	try:
+		yield
+	except:
+		error = True
+		raise
+	finally:
+		record(name, time.perf_counter() - start, error=error)
+
+def snapshot():
+	with _lock:
+		return {name: metric.summary() for name, metric in _metrics.items()}
+
+def reset():
+	global _started
+	with _lock:
+		_metrics.clear()
+		_started = time.time()
+
+def report():
+	lines = ['{0: <40}{1: >7}{2: >7}{3: >10}{4: >10}{5: >9}{6: >9}{7: >9}'.format("Name", "Calls", "Errors", "Out", "In", "p50 ms", "p95 ms", "p99 ms")]
+	for name, summary in sorted(snapshot().items()):
+		lines.append('{0: <40}{1: >7}{2: >7}{3: >10}{4: >10}{5: >9.1f}{6: >9.1f}{7: >9.1f}'.format(
+			name[:39], summary["count"], summary["errors"], summary["bytes_out"], summary["bytes_in"],
+			summary["p50"]*1000, summary["p95"]*1000, summary["p99"]*1000))
+	lines.append("(Since "+time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(_started))+")")
+	return lines
+
+def dump(path):
+	data = {"timestamp": time.time(), "since": _started, "metrics": snapshot()}
+	with open(path, 'a') as f:
+		f.write(json.dumps(data)+"\n")
+
+def startDump(path, interval=60):
+	# Appends a snapshot to path every interval seconds, one JSON object per line
+	def run():
+		while True:
+			time.sleep(interval)
+			try:
+				dump(path)
+			except IOError:
+				pass
+	threading.Thread(target=run, name="stats", daemon=True).start()
@@ -1,4 +1,5 @@
-import sys, datetime, time, os
+import sys, datetime, time, signal, struct, shutil, io, re, stats
+from contextlib import contextmanager
 
 try:
     import msvcrt
@@ -26,6 +27,8 @@ def home():
 	goto(1,1)
 
 def clear():
+	if _capture == None:
+		invalidate()
 	print(u"\u001b[2J",end="")
 	home()
 	
@@ -41,9 +44,36 @@ def color(*args):
 	code += "m"
 	print(code, end="")
 	
+_size = None
+
+def _invalidateSize(signum=None, frame=None):
+	global _size
+	_size = None
+
+try:
+	signal.signal(signal.SIGWINCH, _invalidateSize)
+except (AttributeError, ValueError):
+	pass # No SIGWINCH on this platform or not on the main thread: size is queried every time
+
+def _querySize():
+	try:
+		import fcntl, termios
+		r, c, _, _ = struct.unpack('hhhh', fcntl.ioctl(sys.__stdout__.fileno(), termios.TIOCGWINSZ, b'\0'*8))
+		if r > 0 and c > 0:
+			return (r, c)
+	except (ImportError, OSError, ValueError):
+		pass
+	c, r = shutil.get_terminal_size()
+	return (r, c)
+
 def getSize():
-	r,c = os.popen('stty size', 'r').read().split()
-	return (int(r),int(c))
+	global _size
+	size = _size
+	if size == None:
+		size = _querySize()
+		if hasattr(signal, "SIGWINCH") and signal.getsignal(signal.SIGWINCH) == _invalidateSize:
+			_size = size
+	return size
 	
 def header(text = "", colorFg=37, colorBg=41, colorStyle=1, goHome=True):
 	rows, columns = getSize()
@@ -52,15 +82,141 @@ def header(text = "", colorFg=37, colorBg=41, colorStyle=1, goHome=True):
 	if goHome:
 		home()
 	color(colorFg, colorBg, colorStyle)
-	print(left,end="")
 	if empty > 0:
-		for i in range(empty):
-			print(" ",end="")
+		left += " "*empty
+	print(left,end="")
 	#print(right)
-	color()
+	color(0, 37, 40, 1)
+
+# Frame buffer: output is composed in memory and only the cells that differ from what is on screen get written
+
+_escape = re.compile(u"(\u001b\\[[0-9;?]*[A-Za-z]|\r|\n|\t)")
+_shown = None
+_capture = None
+
+class Screen:
+	def __init__(self, rows, columns):
+		self.rows = rows
+		self.columns = columns
+		self.x = 0
+		self.y = 0
+		self.attr = ""
+		self.cells = [self._blank() for i in range(rows)]
+
+	def _blank(self):
+		return [(" ", "")] * self.columns
+
+	def _newline(self):
+		self.x = 0
+		self.y += 1
+		if self.y >= self.rows:
+			# Scroll like the terminal would
+			self.cells.pop(0)
+			self.cells.append(self._blank())
+			self.y = self.rows - 1
+
+	def _put(self, char):
+		if self.x >= self.columns:
+			self._newline()
+		self.cells[self.y][self.x] = (char, self.attr)
+		self.x += 1
+
+	def _sequence(self, seq):
+		params = seq[2:-1]
+		kind = seq[-1]
+		if kind == "m":
+			if params == "" or params == "0" or params.startswith("0;"):
+				self.attr = seq
+			else:
+				self.attr += seq
+		elif kind == "H":
+			y, _, x = params.partition(";")
+			self.y = min(max(int(y or 1), 1), self.rows) - 1
+			self.x = min(max(int(x or 1), 1), self.columns) - 1
+		elif kind == "J" and params == "2":
+			self.cells = [self._blank() for i in range(self.rows)]
+
+	def write(self, text):
+		for part in _escape.split(text):
+			if part == "":
+				continue
+			if part == "\n":
+				self._newline()
+			elif part == "\r":
+				self.x = 0
+			elif part == "\t":
+				for i in range(8 - self.x % 8):
+					self._put(" ")
+			elif part[0] == u"\u001b":
+				self._sequence(part)
+			else:
+				for char in part:
+					self._put(char)
+
+def render(screen):
+	global _shown
+	previous = _shown
+	out = []
+	if previous == None or previous.rows != screen.rows or previous.columns != screen.columns:
+		# Unknown screen contents: clear it and diff against a blank frame, so blank cells cost nothing
+		out.append(u"\u001b[0m\u001b[2J")
+		previous = Screen(screen.rows, screen.columns)
+	for y in range(screen.rows):
+		row = screen.cells[y]
+		old = previous.cells[y]
+		x = 0
+		while x < screen.columns:
+			if row[x] == old[x]:
+				x += 1
+				continue
+			# Emit the run of changed cells starting here
+			out.append(u"\u001b["+str(y+1)+";"+str(x+1)+"H")
+			attr = None
+			while x < screen.columns and row[x] != old[x]:
+				char, cellAttr = row[x]
+				if cellAttr != attr:
+					out.append(u"\u001b[0m"+cellAttr)
+					attr = cellAttr
+				out.append(char)
+				x += 1
+	out.append(u"\u001b[0m"+screen.attr)
+	out.append(u"\u001b["+str(screen.y+1)+";"+str(screen.x+1)+"H")
+	out = "".join(out)
+	sys.stdout.write(out)
+	sys.stdout.flush()
+	_shown = screen
+	return len(out)
+
+def invalidate():
+	# Forget what is on screen, the next frame is drawn completely
+	global _shown
+	_shown = None
+
+@contextmanager
+def frame():
+	""" Capture everything printed inside the with block and draw it as one frame in a single write. """
+	global _capture
+	if _capture != None:
+		yield # Nested frame: the outer one renders
+		return
+	rows, columns = getSize()
+	stdout = sys.stdout
+	_capture = io.StringIO()
+	sys.stdout = _capture
+	try:
+		yield
+	finally:
+		sys.stdout = stdout
+		text = _capture.getvalue()
+		_capture = None
+	start = time.perf_counter()
+	screen = Screen(rows, columns)
+	screen.write(text)
+	written = render(screen)
+	stats.record("screen redraw", time.perf_counter() - start, written)
 	
 def draw_menu(title, items, selected=0):
-	header(False, title)
+	header(title)
 	for i in range(0, len(items)):
 		if (selected == i):
 			color(30, 47, 0)
@@ -72,7 +228,8 @@ def draw_menu(title, items, selected=0):
 def menu(title, items, selected = 0):
 	clear()
 	while True:
-		draw_menu(title, items, selected)
+		with frame():
+			draw_menu(title, items, selected)
 		key = getch()
 		if (ord(key)==0x1b):
 			key = getch()
@@ -0,0 +1,41 @@
+import json
+import pytest
+from protocol import _ResultStream, ApiError
+
+def split(body, *offsets):
+	chunks = []
+	start = 0
+	for offset in offsets:
+		chunks.append(body[start:offset])
+		start = offset
+	chunks.append(body[start:])
+	return chunks
+
+def decode(chunks, id=1):
+	return list(_ResultStream(chunks, id))
+
+RECORDS = [{"id": i, "name": "Product é "+str(i), "price": 1500.0 + i/4, "weight": -1.5e-3*i, "active": i % 2 == 0, "package": None} for i in range(50)]
+
+@pytest.mark.parametrize("result", [[1500.0], [1, -2, 3.25e+2, True, False, None, "x"], RECORDS])
+def test_split_at_every_offset(result):
+	body = json.dumps({"jsonrpc": "2.0", "result": result, "id": 1}).encode("utf-8")
+	for offset in range(len(body) + 1):
+		assert decode(split(body, offset)) == result
+	# And byte by byte, which also cuts multi-byte characters
+	assert decode([body[i:i+1] for i in range(len(body))]) == result
+	assert decode([body[i:i+2] for i in range(0, len(body), 2)]) == result
+
+def test_empty_result():
+	assert decode([b'{"jsonrpc": "2.0", "id": 1, "result": []}']) == []
+
+def test_error():
+	with pytest.raises(ApiError):
+		decode([b'{"jsonrpc": "2.0", "id": 1, "error": {"code": 5, "message": "no"}}'])
+
+def test_wrong_id():
+	with pytest.raises(ApiError):
+		decode([b'{"jsonrpc": "2.0", "id": 2, "result": [1]}'])
+
+def test_truncated():
+	with pytest.raises(ApiError):
+		decode([b'{"jsonrpc": "2.0", "id": 1, "result": [1500.'])